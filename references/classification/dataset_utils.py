@@ -1,4 +1,4 @@
-from torchvision.datasets import VisionDataset, DatasetFolder
+from torchvision.datasets import VisionDataset, DatasetFolder, ImageFolder
 from torchvision.datasets.folder  import default_loader, IMG_EXTENSIONS
 from PIL import Image
 import os
@@ -79,6 +79,170 @@ class CocoClassification(VisionDataset):
 
 
 
+###############################################################
+IMAGE_FOLDER_INDEX_FILES = ("classes.json", "paths.txt", "offsets.npy", "labels.npy")
+
+
+def has_image_folder_index(index_dir):
+    return all(os.path.exists(os.path.join(index_dir, f)) for f in IMAGE_FOLDER_INDEX_FILES)
+
+
+def _image_folder_index_arrays(dataset):
+    # the paths relative to the root, newline terminated in one byte array, the byte offset of every path and the labels
+    prefix_len = len(os.path.join(dataset.root, ""))
+    paths = [path[prefix_len:].encode() for path, _ in dataset.samples]
+    offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum([len(path) + 1 for path in paths], out=offsets[1:])
+    paths = np.frombuffer(b"".join(path + b"\n" for path in paths), dtype=np.uint8)
+    return paths, offsets, np.asarray(dataset.targets, dtype=np.int64)
+
+
+def save_image_folder_index(dataset, index_dir):
+    """Writes the samples of an ImageFolder style dataset as a lightweight index that FastImageFolder can load.
+
+    The paths are stored relative to the dataset root in a single newline separated file,
+    together with the byte offset of every path and the labels as numpy arrays.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    paths, offsets, labels = _image_folder_index_arrays(dataset)
+    with open(os.path.join(index_dir, "classes.json"), "w") as fp:
+        json.dump(dict(root=os.path.abspath(dataset.root), classes=dataset.classes), fp)
+    #
+    paths.tofile(os.path.join(index_dir, "paths.txt"))
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+    # written last, so that an interrupted write doesn't leave a complete looking index behind
+    np.save(os.path.join(index_dir, "labels.npy"), labels)
+
+
+class FastImageFolder(VisionDataset):
+    """ImageFolder equivalent that loads its samples from an index written by save_image_folder_index.
+
+    The labels, paths and path offsets are memory mapped, so constructing the dataset
+    doesn't need to walk the image folders or unpickle a list of (path, label) tuples.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        loader: Callable[[str], Any] = default_loader,
+    ) -> None:
+        with open(os.path.join(index_dir, "classes.json")) as fp:
+            meta = json.load(fp)
+        #
+        super().__init__(meta["root"], transform=transform, target_transform=target_transform)
+        self.loader = loader
+        self.classes = meta["classes"]
+        self.class_to_idx = {cls_name: i for i, cls_name in enumerate(self.classes)}
+        self._paths = np.memmap(os.path.join(index_dir, "paths.txt"), dtype=np.uint8, mode="r")
+        self._offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+        self.targets = np.load(os.path.join(index_dir, "labels.npy"), mmap_mode="r")
+
+    def __getitem__(self, index: int) -> Tuple[Any, Any]:
+        # the path is followed by a newline, which is not part of it
+        start, end = self._offsets[index], self._offsets[index + 1] - 1
+        path = os.path.join(self.root, self._paths[start:end].tobytes().decode())
+        sample = self.loader(path)
+        target = int(self.targets[index])
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return sample, target
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+
+class IndexedImageFolder(ImageFolder):
+    """ImageFolder that keeps the result of its directory scan in an index file inside the root folder.
+
+    The index is reused as long as the class folders are the same and their modification times
+    are unchanged, which avoids walking all the images on every run. Changes in nested sub folders
+    of the class folders are not detected, delete the index file to force a rescan. If the index
+    can't be written (for example a read only dataset folder), this behaves like ImageFolder.
+
+    The index holds the same arrays as save_image_folder_index, in a single .npz file (a folder in
+    the root would be found as a class), and is loaded without unpickling anything.
+    """
+    INDEX_FILE = ".imagefolder_index.npz"
+
+    def __init__(
+        self,
+        root: str,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        loader: Callable[[str], Any] = default_loader,
+        is_valid_file: Optional[Callable[[str], bool]] = None,
+    ):
+        self._index = self._load_index(root)
+        super().__init__(root, transform=transform, target_transform=target_transform,
+                         loader=loader, is_valid_file=is_valid_file)
+        if self._index is None:
+            self._save_index()
+        #
+        self._index = None
+
+    @staticmethod
+    def _folder_mtimes(root, classes):
+        # the root folder itself is left out, writing the index into it changes its mtime
+        return np.array([os.stat(os.path.join(root, cls_name)).st_mtime_ns for cls_name in classes], dtype=np.int64)
+
+    def _load_index(self, root):
+        index_path = os.path.join(root, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        #
+        try:
+            with np.load(index_path, allow_pickle=False) as index_data:
+                classes = index_data["classes"].tolist()
+                mtimes = index_data["mtimes"]
+                paths = index_data["paths"].tobytes().decode().split("\n")[:-1]
+                labels = index_data["labels"].tolist()
+            #
+            # listing the class folders is cheap compared to walking all the images
+            found_classes, _ = super().find_classes(root)
+            if (classes != found_classes or len(paths) != len(labels)
+                    or not np.array_equal(mtimes, self._folder_mtimes(root, classes))):
+                return None
+            #
+        except (OSError, ValueError, KeyError, UnicodeDecodeError):
+            return None
+        #
+        return dict(classes=classes, class_to_idx={cls_name: i for i, cls_name in enumerate(classes)},
+                    samples=list(zip(paths, labels)))
+
+    def _save_index(self):
+        paths, offsets, labels = _image_folder_index_arrays(self)
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, classes=np.array(self.classes, dtype=str),
+                     mtimes=self._folder_mtimes(self.root, self.classes),
+                     paths=paths, offsets=offsets, labels=labels)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Could not write the image folder index {index_path}: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            #
+        #
+
+    def find_classes(self, directory: str) -> Tuple[List[str], Dict[str, int]]:
+        if self._index is not None:
+            return self._index["classes"], self._index["class_to_idx"]
+        #
+        return super().find_classes(directory)
+
+    def make_dataset(self, directory: str, class_to_idx: Dict[str, int], *args, **kwargs) -> List[Tuple[str, int]]:
+        if self._index is not None:
+            return [(os.path.join(directory, path), target) for path, target in self._index["samples"]]
+        #
+        return super().make_dataset(directory, class_to_idx, *args, **kwargs)
+
+
 ###############################################################
 class DataListClassification(DatasetFolder):
     def __init__(
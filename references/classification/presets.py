@@ -16,7 +16,11 @@ class ClassificationPresetTrain:
         ra_magnitude=9,
         augmix_severity=3,
         random_erase_prob=0.0,
+        normalize=True,
     ):
+        if random_erase_prob > 0 and not normalize:
+            raise ValueError("Random erasing requires normalize=True as it operates on normalized float images.")
+
         trans = [transforms.RandomResizedCrop(crop_size, interpolation=interpolation)]
         if hflip_prob > 0:
             trans.append(transforms.RandomHorizontalFlip(hflip_prob))
@@ -30,13 +34,14 @@ class ClassificationPresetTrain:
             else:
                 aa_policy = autoaugment.AutoAugmentPolicy(auto_augment_policy)
                 trans.append(autoaugment.AutoAugment(policy=aa_policy, interpolation=interpolation))
-        trans.extend(
-            [
-                transforms.PILToTensor(),
-                transforms.ConvertImageDtype(torch.float),
-                transforms.Normalize(mean=mean, std=std),
-            ]
-        )
+        trans.append(transforms.PILToTensor())
+        if normalize:
+            trans.extend(
+                [
+                    transforms.ConvertImageDtype(torch.float),
+                    transforms.Normalize(mean=mean, std=std),
+                ]
+            )
         if random_erase_prob > 0:
             trans.append(transforms.RandomErasing(p=random_erase_prob))
 
@@ -55,17 +60,22 @@ class ClassificationPresetEval:
         mean=(0.485, 0.456, 0.406),
         std=(0.229, 0.224, 0.225),
         interpolation=InterpolationMode.BILINEAR,
+        normalize=True,
     ):
+        trans = [
+            transforms.Resize(resize_size, interpolation=interpolation),
+            transforms.CenterCrop(crop_size),
+            transforms.PILToTensor(),
+        ]
+        if normalize:
+            trans.extend(
+                [
+                    transforms.ConvertImageDtype(torch.float),
+                    transforms.Normalize(mean=mean, std=std),
+                ]
+            )
 
-        self.transforms = transforms.Compose(
-            [
-                transforms.Resize(resize_size, interpolation=interpolation),
-                transforms.CenterCrop(crop_size),
-                transforms.PILToTensor(),
-                transforms.ConvertImageDtype(torch.float),
-                transforms.Normalize(mean=mean, std=std),
-            ]
-        )
+        self.transforms = transforms.Compose(trans)
 
     def __call__(self, img):
         return self.transforms(img)
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import os
 import time
 import warnings
@@ -12,7 +13,6 @@ import transforms
 import utils
 from sampler import RASampler
 from torch import nn
-from torch.utils.data.dataloader import default_collate
 from torchvision.transforms.functional import InterpolationMode
 
 import dataset_utils
@@ -20,49 +20,85 @@ import model_utils
 import edgeai_torchmodelopt
 
 
-def train_one_epoch(model, criterion, optimizer, data_loader, device, epoch, args, model_ema=None, scaler=None):
+def _update_metrics(metric_logger, pending, **kwargs):
+    """Moves the per-iteration metrics kept on the device into the metric logger with a single synchronization"""
+    values = torch.stack([metrics for metrics, _ in pending]).tolist()
+    for (loss, acc1, acc5), (_, batch_size) in zip(values, pending):
+        metric_logger.update(loss=loss, **kwargs)
+        metric_logger.meters["acc1"].update(acc1, n=batch_size)
+        metric_logger.meters["acc5"].update(acc5, n=batch_size)
+    pending.clear()
+
+
+def train_one_epoch(
+    model, criterion, optimizer, data_loader, device, epoch, args, model_ema=None, scaler=None, mixupcutmix=None
+):
     model.train()
     metric_logger = utils.MetricLogger(delimiter="  ")
     metric_logger.add_meter("lr", utils.SmoothedValue(window_size=1, fmt="{value}"))
     metric_logger.add_meter("img/s", utils.SmoothedValue(window_size=10, fmt="{value}"))
     dataset_len = len(data_loader)
 
+    # look up the settings once instead of in every iteration
+    print_freq = args.print_freq
+    clip_grad_norm = args.clip_grad_norm
+    if clip_grad_norm is not None:
+        # collect the parameters once, and use the multi tensor kernels that compute the
+        # total norm for all the gradients at once - they are not available for cpu tensors
+        clip_grad_params = list(model.parameters())
+        clip_grad_foreach = True if device.type == "cuda" else None
+    model_ema_steps = args.model_ema_steps
+    reset_ema = epoch < args.lr_warmup_epochs
+    channels_last = args.channels_last
+    amp, amp_dtype = args.amp, args.amp_dtype
+    lr_param_group = optimizer.param_groups[0]
+    img_per_sec_meter = metric_logger.meters["img/s"]
+    epoch_size = round(args.train_epoch_size_factor * dataset_len) if args.train_epoch_size_factor else None
+    last_iter = dataset_len - 1 if epoch_size is None else min(epoch_size, dataset_len - 1)
+
     header = f"Epoch: [{epoch}]"
-    for i, (image, target) in enumerate(metric_logger.log_every(data_loader, args.print_freq, header)):
+    for i, (image, target) in enumerate(metric_logger.log_every(data_loader, print_freq, header)):
         start_time = time.time()
-        image, target = image.to(device), target.to(device)
-        with torch.cuda.amp.autocast(enabled=scaler is not None):
+        image = image.to(device, non_blocking=True)
+        target = target.to(device, non_blocking=True)
+        if mixupcutmix is not None:
+            image, target = mixupcutmix(image, target)
+        if channels_last:
+            image = image.to(memory_format=torch.channels_last)
+        with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=amp):
             output = model(image)
             loss = criterion(output, target)
 
-        optimizer.zero_grad()
+        optimizer.zero_grad(set_to_none=True)
         if scaler is not None:
             scaler.scale(loss).backward()
-            if args.clip_grad_norm is not None:
+            if clip_grad_norm is not None:
                 # we should unscale the gradients of optimizer's assigned params if do gradient clipping
                 scaler.unscale_(optimizer)
-                nn.utils.clip_grad_norm_(model.parameters(), args.clip_grad_norm)
+                nn.utils.clip_grad_norm_(clip_grad_params, clip_grad_norm, foreach=clip_grad_foreach)
             scaler.step(optimizer)
             scaler.update()
         else:
             loss.backward()
-            if args.clip_grad_norm is not None:
-                nn.utils.clip_grad_norm_(model.parameters(), args.clip_grad_norm)
+            if clip_grad_norm is not None:
+                nn.utils.clip_grad_norm_(clip_grad_params, clip_grad_norm, foreach=clip_grad_foreach)
             optimizer.step()
 
-        if model_ema and i % args.model_ema_steps == 0:
+        if model_ema and i % model_ema_steps == 0:
             model_ema.update_parameters(model)
-            if epoch < args.lr_warmup_epochs:
+            if reset_ema:
                 # Reset ema buffer to keep copying weights during warmup period
                 model_ema.n_averaged.fill_(0)
 
-        acc1, acc5 = utils.accuracy(output, target, topk=(1, 5))
         batch_size = image.shape[0]
-        metric_logger.update(loss=loss.item(), lr=optimizer.param_groups[0]["lr"])
-        metric_logger.meters["acc1"].update(acc1.item(), n=batch_size)
-        metric_logger.meters["acc5"].update(acc5.item(), n=batch_size)
-        metric_logger.meters["img/s"].update(batch_size / (time.time() - start_time))
-        if args.train_epoch_size_factor and i >= round(args.train_epoch_size_factor * dataset_len):
+        # the training loss and accuracy are only sampled on the iterations that are printed,
+        # which saves the accuracy computation and the device synchronization on all the others
+        if i % print_freq == 0 or i == last_iter:
+            acc1_acc5 = utils.accuracy_top1_top5(output, target)
+            metrics = torch.cat([loss.detach().view(1), acc1_acc5])
+            _update_metrics(metric_logger, [(metrics, batch_size)], lr=lr_param_group["lr"])
+        img_per_sec_meter.update(batch_size / (time.time() - start_time))
+        if epoch_size is not None and i >= epoch_size:
             break
 
 
@@ -72,27 +108,35 @@ def evaluate(args, model, criterion, data_loader, device, print_freq=100, log_su
     header = f"Test: {log_suffix}"
     dataset_len = len(data_loader)
 
-    num_processed_samples = 0
+    pending_metrics = []
+    channels_last = args.channels_last
+    epoch_size = round(args.val_epoch_size_factor * dataset_len) if args.val_epoch_size_factor else None
     with torch.inference_mode():
         for i, (image, target) in enumerate(metric_logger.log_every(data_loader, print_freq, header)):
             image = image.to(device, non_blocking=True)
             target = target.to(device, non_blocking=True)
+            if channels_last:
+                image = image.to(memory_format=torch.channels_last)
             output = model(image)
             loss = criterion(output, target)
 
-            acc1, acc5 = utils.accuracy(output, target, topk=(1, 5))
+            acc1_acc5 = utils.accuracy_top1_top5(output, target)
             # FIXME need to take into account that the datasets
             # could have been padded in distributed setup
             batch_size = image.shape[0]
-            metric_logger.update(loss=loss.item())
-            metric_logger.meters["acc1"].update(acc1.item(), n=batch_size)
-            metric_logger.meters["acc5"].update(acc5.item(), n=batch_size)
-            num_processed_samples += batch_size
-            if args.val_epoch_size_factor and i >= round(args.val_epoch_size_factor * dataset_len):
+            pending_metrics.append((torch.cat([loss.view(1), acc1_acc5]), batch_size))
+            if i % print_freq == 0:
+                _update_metrics(metric_logger, pending_metrics)
+            if epoch_size is not None and i >= epoch_size:
                 break
+
+        if pending_metrics:
+            _update_metrics(metric_logger, pending_metrics)
     # gather the stats from all processes
+    metric_logger.synchronize_between_processes()
 
-    num_processed_samples = utils.reduce_across_processes(num_processed_samples)
+    # every processed sample was counted once in the acc1 meter
+    num_processed_samples = metric_logger.acc1.count
     if (
         hasattr(data_loader.dataset, "__len__")
         and len(data_loader.dataset) != num_processed_samples
@@ -106,21 +150,37 @@ def evaluate(args, model, criterion, data_loader, device, print_freq=100, log_su
             "Setting the world size to 1 is always a safe bet."
         )
 
-    metric_logger.synchronize_between_processes()
-
     print(f"{header} Acc@1 {metric_logger.acc1.global_avg:.3f} Acc@5 {metric_logger.acc5.global_avg:.3f}")
     return metric_logger.acc1.global_avg
 
 
 def _get_cache_path(filepath):
-    import hashlib
-
-    h = hashlib.sha1(filepath.encode()).hexdigest()
-    cache_path = os.path.join("~", ".torch", "vision", "datasets", "imagefolder", h[:10] + ".pt")
+    # a readable name, with a short hash of the full path as the separator replacement is not unique
+    # (/a/b_c and /a_b/c would both become _a_b_c)
+    filepath = os.path.abspath(filepath)
+    path_hash = hashlib.sha1(filepath.encode()).hexdigest()[:10]
+    cache_name = filepath.replace(os.sep, "_") + "_" + path_hash
+    cache_path = os.path.join("~", ".torch", "vision", "datasets", "imagefolder", cache_name)
     cache_path = os.path.expanduser(cache_path)
     return cache_path
 
 
+def _load_image_folder(folder, transform, args, log_name):
+    cache_path = _get_cache_path(folder)
+    if args.cache_dataset and dataset_utils.has_image_folder_index(cache_path):
+        print(f"Loading {log_name} index from {cache_path}")
+        return dataset_utils.FastImageFolder(cache_path, transform)
+    #
+    dataset = dataset_utils.IndexedImageFolder(folder, transform)
+    if args.cache_dataset:
+        print(f"Saving {log_name} index to {cache_path}")
+        if utils.is_main_process():
+            dataset_utils.save_image_folder_index(dataset, cache_path)
+        #
+    #
+    return dataset
+
+
 def load_data(traindir, valdir, args):
     # Data loading code
     print("Loading data")
@@ -130,74 +190,54 @@ def load_data(traindir, valdir, args):
         args.train_crop_size,
     )
     interpolation = InterpolationMode(args.interpolation)
+    # args may come from train_quantization.py which doesn't define it
+    gpu_normalize = getattr(args, "gpu_normalize", False)
 
     print("Loading training data")
     st = time.time()
-    cache_path = _get_cache_path(traindir)
-    if args.cache_dataset and os.path.exists(cache_path):
-        # Attention, as the transforms are also cached!
-        print(f"Loading dataset_train from {cache_path}")
-        dataset, _ = torch.load(cache_path)
+    # We need a default value for the variables below because args may come
+    # from train_quantization.py which doesn't define them.
+    auto_augment_policy = getattr(args, "auto_augment", None)
+    random_erase_prob = getattr(args, "random_erase", 0.0)
+    ra_magnitude = getattr(args, "ra_magnitude", None)
+    augmix_severity = getattr(args, "augmix_severity", None)
+    train_transform = presets.ClassificationPresetTrain(
+        crop_size=train_crop_size,
+        interpolation=interpolation,
+        auto_augment_policy=auto_augment_policy,
+        random_erase_prob=random_erase_prob,
+        ra_magnitude=ra_magnitude,
+        augmix_severity=augmix_severity,
+        normalize=not gpu_normalize,
+    )
+    if args.dataset == 'modelmaker':
+        train_folders = os.path.normpath(traindir).split(os.sep)
+        train_anno = os.path.join(os.sep.join(train_folders[:-1]), 'annotations', f'{args.annotation_prefix}_train.json')
+        dataset = dataset_utils.CocoClassification(traindir, train_anno, train_transform)
     else:
-        # We need a default value for the variables below because args may come
-        # from train_quantization.py which doesn't define them.
-        auto_augment_policy = getattr(args, "auto_augment", None)
-        random_erase_prob = getattr(args, "random_erase", 0.0)
-        ra_magnitude = getattr(args, "ra_magnitude", None)
-        augmix_severity = getattr(args, "augmix_severity", None)
-        train_transform = presets.ClassificationPresetTrain(
-	                crop_size=train_crop_size,
-	                interpolation=interpolation,
-	                auto_augment_policy=auto_augment_policy,
-	                random_erase_prob=random_erase_prob,
-	                ra_magnitude=ra_magnitude,
-	                augmix_severity=augmix_severity,
-	    )
-        if args.dataset == 'modelmaker':
-            train_folders = os.path.normpath(traindir).split(os.sep)
-            train_anno = os.path.join(os.sep.join(train_folders[:-1]), 'annotations', f'{args.annotation_prefix}_train.json')
-            dataset = dataset_utils.CocoClassification(traindir, train_anno, train_transform)
-        else:
-            dataset = torchvision.datasets.ImageFolder(
-	            traindir,
-	            train_transform,
-            )
-		#
-        if args.cache_dataset:
-            print(f"Saving dataset_train to {cache_path}")
-            utils.mkdir(os.path.dirname(cache_path))
-            utils.save_on_master((dataset, traindir), cache_path)
+        dataset = _load_image_folder(traindir, train_transform, args, "dataset_train")
+    #
     print("Took", time.time() - st)
 
     print("Loading validation data")
-    cache_path = _get_cache_path(valdir)
-    if args.cache_dataset and os.path.exists(cache_path):
-        # Attention, as the transforms are also cached!
-        print(f"Loading dataset_test from {cache_path}")
-        dataset_test, _ = torch.load(cache_path)
+    if args.weights_enum and args.test_only:
+        weights = torchvision.models.get_weight(args.weights_enum)
+        preprocessing = weights.transforms()
     else:
-        if args.weights_enum and args.test_only:
-            weights = torchvision.models.get_weight(args.weights_enum)
-            preprocessing = weights.transforms()
-        else:
-            preprocessing = presets.ClassificationPresetEval(
-                crop_size=val_crop_size, resize_size=val_resize_size, interpolation=interpolation
-            )
+        preprocessing = presets.ClassificationPresetEval(
+            crop_size=val_crop_size,
+            resize_size=val_resize_size,
+            interpolation=interpolation,
+            normalize=not gpu_normalize,
+        )
 
-        if args.dataset == 'modelmaker':
-            val_folders = os.path.normpath(valdir).split(os.sep)
-            val_anno = os.path.join(os.sep.join(val_folders[:-1]), 'annotations', f'{args.annotation_prefix}_val.json')
-            dataset_test = dataset_utils.CocoClassification(valdir, val_anno, preprocessing)
-        else:
-            dataset_test = torchvision.datasets.ImageFolder(
-                valdir,
-                preprocessing,
-            )
-        #
-        if args.cache_dataset:
-            print(f"Saving dataset_test to {cache_path}")
-            utils.mkdir(os.path.dirname(cache_path))
-            utils.save_on_master((dataset_test, valdir), cache_path)
+    if args.dataset == 'modelmaker':
+        val_folders = os.path.normpath(valdir).split(os.sep)
+        val_anno = os.path.join(os.sep.join(val_folders[:-1]), 'annotations', f'{args.annotation_prefix}_val.json')
+        dataset_test = dataset_utils.CocoClassification(valdir, val_anno, preprocessing)
+    else:
+        dataset_test = _load_image_folder(valdir, preprocessing, args, "dataset_test")
+    #
 
     print("Creating data loaders")
     if args.distributed:
@@ -259,6 +299,9 @@ def main(args):
     if args.distributed and args.parallel:
         raise RuntimeError("both DistributedDataParallel and DataParallel cannot be used simultaneously")
 
+    if args.eval_interval < 1:
+        raise RuntimeError(f"Invalid eval-interval {args.eval_interval}. It must be 1 or more.")
+
     device = torch.device(args.device)
 
     if args.use_deterministic_algorithms:
@@ -267,34 +310,51 @@ def main(args):
     else:
         torch.backends.cudnn.benchmark = True
 
+    # TF32 tensor cores for the float32 matmuls and convolutions on Ampere and newer gpus.
+    # only for float training on cuda - quantized runs keep the pytorch defaults
+    if device.type == "cuda" and not args.quantization:
+        torch.backends.cuda.matmul.allow_tf32 = bool(args.allow_tf32)
+        torch.backends.cudnn.allow_tf32 = bool(args.allow_tf32)
+
     train_dir = os.path.join(args.data_path, "train")
     val_dir = os.path.join(args.data_path, "val")
     dataset, dataset_test, train_sampler, test_sampler = load_data(train_dir, val_dir, args)
 
-    collate_fn = None
     num_classes = len(dataset.classes)
     mixup_transforms = []
     if args.mixup_alpha > 0.0:
         mixup_transforms.append(transforms.RandomMixup(num_classes, p=1.0, alpha=args.mixup_alpha))
     if args.cutmix_alpha > 0.0:
         mixup_transforms.append(transforms.RandomCutmix(num_classes, p=1.0, alpha=args.cutmix_alpha))
+    # mixup/cutmix is applied to the batches on the device in train_one_epoch, so that the workers
+    # don't have to ship float images and num_classes wide soft targets
+    mixupcutmix = None
     if mixup_transforms:
         mixupcutmix = torchvision.transforms.RandomChoice(mixup_transforms)
 
-        def collate_fn(batch):
-            return mixupcutmix(*default_collate(batch))
-
+    # keep the workers alive across epochs and queue more batches per worker
+    # both options are only valid when worker processes are used
+    worker_kwargs = dict(persistent_workers=True, prefetch_factor=args.prefetch_factor) if args.workers > 0 else dict()
     data_loader = torch.utils.data.DataLoader(
         dataset,
         batch_size=args.batch_size,
         sampler=train_sampler,
         num_workers=args.workers,
         pin_memory=True,
-        collate_fn=collate_fn,
+        **worker_kwargs,
     )
     data_loader_test = torch.utils.data.DataLoader(
-        dataset_test, batch_size=args.batch_size, sampler=test_sampler, num_workers=args.workers, pin_memory=True
+        dataset_test,
+        batch_size=args.batch_size,
+        sampler=test_sampler,
+        num_workers=args.workers,
+        pin_memory=True,
+        **worker_kwargs,
     )
+    # overlap the host-to-device copy of the next batch with the compute of the current one
+    # with --gpu-normalize the workers return uint8 images which are normalized after the transfer
+    data_loader = utils.DataPrefetcher(data_loader, device, normalize=args.gpu_normalize)
+    data_loader_test = utils.DataPrefetcher(data_loader_test, device, normalize=args.gpu_normalize)
 
     print("Creating model")
     model, surgery_kwargs = model_utils.get_model(args.model, weights=args.weights_enum, num_classes=num_classes, model_surgery=args.model_surgery)
@@ -326,12 +386,26 @@ def main(args):
 
     model.to(device)
 
+    if args.channels_last:
+        if device.type != "cuda" or args.quantization:
+            print("Ignoring --channels-last as it is only used for float training on cuda")
+            args.channels_last = False
+        else:
+            # lets cudnn pick the NHWC kernels for the convolutions
+            model = model.to(memory_format=torch.channels_last)
+
     if args.distributed and args.sync_bn:
+        # recent versions of SyncBatchNorm exchange the mean, invstd and count of a layer in one combined
+        # all_gather in forward and one all_reduce in backward. the collectives can't be batched across
+        # layers as every layer needs its reduced statistics before the next one can run.
+        torch_version = tuple(int(v) for v in torch.__version__.split(".")[:2])
+        assert torch_version >= (1, 9), "--sync-bn requires PyTorch 1.9 or newer for the batched SyncBatchNorm collectives"
         model = torch.nn.SyncBatchNorm.convert_sync_batchnorm(model)
 
     if args.compile_model:
         print("Compiling the model using PyTorch2.0 functionality")
-        model = torch.compile(model)
+        # the batch and crop sizes are fixed, so shape specialization costs nothing and avoids guard overhead
+        model = torch.compile(model, mode=args.compile_mode, dynamic=False)
 
     criterion = nn.CrossEntropyLoss(label_smoothing=args.label_smoothing)
 
@@ -368,7 +442,9 @@ def main(args):
     else:
         raise RuntimeError(f"Invalid optimizer {args.opt}. Only SGD, RMSprop and AdamW are supported.")
 
-    scaler = torch.cuda.amp.GradScaler() if args.amp else None
+    # bfloat16 has the same range as float32, so its gradients don't need to be scaled
+    args.amp_dtype = {"fp16": torch.float16, "bf16": torch.bfloat16}[args.amp_dtype]
+    scaler = torch.cuda.amp.GradScaler() if args.amp and args.amp_dtype == torch.float16 else None
 
     args.lr_scheduler = args.lr_scheduler.lower()
     if args.lr_scheduler == "steplr":
@@ -406,7 +482,15 @@ def main(args):
 
     model_without_ddp = model
     if args.distributed:
-        model = torch.nn.parallel.DistributedDataParallel(model, device_ids=[args.gpu], find_unused_parameters=True)
+        # larger gradient buckets mean fewer all_reduce calls, and gradient_as_bucket_view
+        # lets the gradients alias the buckets instead of being copied into them
+        model = torch.nn.parallel.DistributedDataParallel(
+            model,
+            device_ids=[args.gpu],
+            find_unused_parameters=bool(args.find_unused_parameters),
+            bucket_cap_mb=args.ddp_bucket_cap_mb,
+            gradient_as_bucket_view=True,
+        )
         model_without_ddp = model.module
     elif args.parallel:
         model = torch.nn.parallel.DataParallel(model)
@@ -426,7 +510,8 @@ def main(args):
         model_ema = utils.ExponentialMovingAverage(model_without_ddp, device=device, decay=1.0 - alpha)
 
     if args.resume:
-        checkpoint = torch.load(args.resume, map_location="cpu")
+        # load the tensors straight to the device they end up on instead of staging them on the cpu
+        checkpoint = torch.load(args.resume, map_location=device)
         model_without_ddp.load_state_dict(checkpoint["model"])
         if not args.test_only:
             optimizer.load_state_dict(checkpoint["optimizer"])
@@ -454,11 +539,14 @@ def main(args):
     for epoch in range(args.start_epoch, args.epochs):
         if args.distributed:
             train_sampler.set_epoch(epoch)
-        train_one_epoch(model, criterion, optimizer, data_loader, device, epoch, args, model_ema, scaler)
+        train_one_epoch(model, criterion, optimizer, data_loader, device, epoch, args, model_ema, scaler, mixupcutmix)
         lr_scheduler.step()
-        epoch_acc = evaluate(args, model, criterion, data_loader_test, device=device)
-        if model_ema:
-            epoch_acc = evaluate(args, model_ema, criterion, data_loader_test, device=device, log_suffix="EMA")
+        # the epochs whose checkpoints are kept are always evaluated
+        epoch_acc = None
+        if epoch == 0 or epoch >= (args.epochs-10) or epoch % args.eval_interval == 0:
+            epoch_acc = evaluate(args, model, criterion, data_loader_test, device=device)
+            if model_ema:
+                epoch_acc = evaluate(args, model_ema, criterion, data_loader_test, device=device, log_suffix="EMA")
         if args.output_dir:
             checkpoint = {
                 "model": model_without_ddp.state_dict(),
@@ -474,7 +562,7 @@ def main(args):
             if epoch == 0 or epoch >= (args.epochs-10):
                 utils.save_on_master(checkpoint, os.path.join(args.output_dir, f"checkpoint_{epoch}.pth"))
                 export_model(args, model_without_ddp, epoch, f"model_{epoch}.onnx")
-            if epoch_acc >= best_acc:
+            if epoch_acc is not None and epoch_acc >= best_acc:
                 utils.save_on_master(checkpoint, os.path.join(args.output_dir, "checkpoint.pth"))
                 export_model(args, model_without_ddp, epoch, f"model.onnx")
                 best_acc = epoch_acc
@@ -503,6 +591,9 @@ def get_args_parser(add_help=True):
     parser.add_argument(
         "-j", "--workers", default=16, type=int, metavar="N", help="number of data loading workers (default: 16)"
     )
+    parser.add_argument(
+        "--prefetch-factor", default=4, type=int, help="number of batches loaded in advance by each worker (default: 4)"
+    )
     parser.add_argument("--opt", default="sgd", type=str, help="optimizer")
     parser.add_argument("--lr", default=0.1, type=float, help="initial learning rate")
     parser.add_argument("--momentum", default=0.9, type=float, metavar="M", help="momentum")
@@ -548,13 +639,19 @@ def get_args_parser(add_help=True):
     parser.add_argument("--lr-gamma", default=0.1, type=float, help="decrease lr by a factor of lr-gamma")
     parser.add_argument("--lr-min", default=0.0, type=float, help="minimum lr of lr schedule (default: 0.0)")
     parser.add_argument("--print-freq", default=100, type=int, help="print frequency")
+    parser.add_argument(
+        "--eval-interval",
+        default=1,
+        type=int,
+        help="evaluate every eval-interval epochs, the first and the last 10 epochs are always evaluated (default: 1)",
+    )
     parser.add_argument("--output-dir", default=".", type=str, help="path to save outputs")
     parser.add_argument("--resume", default="", type=str, help="path of checkpoint")
     parser.add_argument("--start-epoch", default=0, type=int, metavar="N", help="start epoch")
     parser.add_argument(
         "--cache-dataset",
         dest="cache_dataset",
-        help="Cache the datasets for quicker initialization. It also serializes the transforms",
+        help="Cache an index of the image folders for quicker initialization",
         action="store_true",
     )
     parser.add_argument(
@@ -573,9 +670,35 @@ def get_args_parser(add_help=True):
     parser.add_argument("--ra-magnitude", default=9, type=int, help="magnitude of auto augment policy")
     parser.add_argument("--augmix-severity", default=3, type=int, help="severity of augmix policy")
     parser.add_argument("--random-erase", default=0.0, type=float, help="random erasing probability (default: 0.0)")
+    parser.add_argument(
+        "--gpu-normalize",
+        action="store_true",
+        help="load uint8 images and normalize them on the device after the transfer (not compatible with --random-erase)",
+    )
+
+    parser.add_argument(
+        "--channels-last",
+        action="store_true",
+        help="Use the channels_last memory format for the model and the inputs (for convolutional models on cuda)",
+    )
 
     # Mixed precision training parameters
     parser.add_argument("--amp", action="store_true", help="Use torch.cuda.amp for mixed precision training")
+    parser.add_argument(
+        "--allow-tf32",
+        default=1,
+        type=int,
+        help="Use TF32 for float32 matmuls and convolutions in float training on cuda, ignored for quantization and cpu. "
+        "pytorch already uses TF32 for the convolutions by default, so 1 enables it for the matmuls "
+        "and 0 disables it for the convolutions too (default: 1)",
+    )
+    parser.add_argument(
+        "--amp-dtype",
+        default="fp16",
+        type=str,
+        choices=["fp16", "bf16"],
+        help="data type used for mixed precision training, bf16 requires Ampere or newer (default: fp16)",
+    )
 
     # distributed training parameters
     parser.add_argument("--world-size", default=1, type=int, help="number of distributed processes")
@@ -583,6 +706,16 @@ def get_args_parser(add_help=True):
     parser.add_argument("--distributed", default=0, type=int,
                         help="use dstributed training even if this script is not launched using torch.disctibuted.launch or run")
     parser.add_argument("--parallel", default=0, type=int, help="can use data parallel mode with distributed is not used")
+    parser.add_argument(
+        "--find-unused-parameters",
+        default=0,
+        type=int,
+        help="let DistributedDataParallel search for parameters that don't receive gradients every iteration - "
+        "only needed for models with unused branches (default: 0)",
+    )
+    parser.add_argument(
+        "--ddp-bucket-cap-mb", default=50, type=int, help="gradient bucket size in MB for DistributedDataParallel (default: 50)"
+    )
 
     parser.add_argument(
         "--model-ema", action="store_true", help="enable tracking Exponential Moving Average of model parameters"
@@ -637,6 +770,13 @@ def get_args_parser(add_help=True):
     parser.add_argument("--pruning-m", type=int, help="The value of m in n:m pruning. Used only in case of n:m pruning")
     
     parser.add_argument("--compile-model", default=0, type=int, help="Compile the model using PyTorch2.0 functionality")
+    parser.add_argument(
+        "--compile-mode",
+        default="max-autotune",
+        type=str,
+        choices=["default", "reduce-overhead", "max-autotune", "max-autotune-no-cudagraphs"],
+        help="torch.compile mode - applies only if compile-model is enabled (default: max-autotune)",
+    )
     parser.add_argument("--opset-version", default=18, type=int, help="ONNX Opset version")
     parser.add_argument("--train-epoch-size-factor", default=0.0, type=float,
                         help="Training validation breaks after one iteration - for quick experimentation")
@@ -92,8 +92,18 @@ class MetricLogger:
         return self.delimiter.join(loss_str)
 
     def synchronize_between_processes(self):
-        for meter in self.meters.values():
-            meter.synchronize_between_processes()
+        """
+        Reduces the count and total of all the meters with a single all_reduce.
+        Warning: does not synchronize the deques!
+        """
+        meters = list(self.meters.values())
+        if not meters:
+            return
+        t = reduce_across_processes([v for meter in meters for v in (meter.count, meter.total)])
+        t = t.tolist()
+        for meter, count, total in zip(meters, t[0::2], t[1::2]):
+            meter.count = int(count)
+            meter.total = total
 
     def add_meter(self, name, meter):
         self.meters[name] = meter
@@ -156,6 +166,71 @@ class MetricLogger:
         print(f"{header} Total time: {total_time_str}")
 
 
+class DataPrefetcher:
+    """Wraps a data loader and copies the next batch to the device on a side CUDA stream
+    while the current batch is being processed, so that the host-to-device transfer
+    overlaps with compute. On non-CUDA devices the batches are copied synchronously.
+
+    If ``normalize`` is set, uint8 image batches are converted to float and normalized
+    with ``mean`` and ``std`` on the device, which lets the loader workers ship uint8
+    images (4x fewer bytes than float32). Batches that are already float are left as is.
+    """
+
+    def __init__(
+        self, loader, device, normalize=False, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)
+    ):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream() if self.device.type == "cuda" else None
+        self.mean = None
+        self.std = None
+        if normalize:
+            # the images are in the [0, 255] range, scale the statistics accordingly
+            self.mean = (torch.tensor(mean) * 255).view(1, -1, 1, 1).to(self.device)
+            self.std = (torch.tensor(std) * 255).view(1, -1, 1, 1).to(self.device)
+
+    @property
+    def dataset(self):
+        return self.loader.dataset
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _to_device(self, image, target):
+        image = image.to(self.device, non_blocking=True)
+        target = target.to(self.device, non_blocking=True)
+        if self.mean is not None and image.dtype == torch.uint8:
+            image = image.float().sub_(self.mean).div_(self.std)
+        return image, target
+
+    def _preload(self, loader_iter):
+        try:
+            image, target = next(loader_iter)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return self._to_device(image, target)
+
+    def __iter__(self):
+        if self.stream is None:
+            for image, target in self.loader:
+                yield self._to_device(image, target)
+            return
+
+        loader_iter = iter(self.loader)
+        batch = self._preload(loader_iter)
+        while batch is not None:
+            current_stream = torch.cuda.current_stream()
+            current_stream.wait_stream(self.stream)
+            image, target = batch
+            # the tensors were allocated on the side stream, make sure the caching
+            # allocator does not reuse their memory while they are still in use here
+            image.record_stream(current_stream)
+            target.record_stream(current_stream)
+            batch = self._preload(loader_iter)
+            yield image, target
+
+
 class ExponentialMovingAverage(torch.optim.swa_utils.AveragedModel):
     """Maintains moving averages of model parameters using an exponential decay.
     ``ema_avg = decay * avg_model_param + (1 - decay) * model_param``
@@ -196,6 +271,21 @@ def accuracy(output, target, topk=(1,)):
         return res
 
 
+def accuracy_top1_top5(output, target):
+    """Computes the top-1 and top-5 accuracy with a single topk and returns both in one 2-element tensor"""
+    with torch.inference_mode():
+        batch_size = target.size(0)
+        if target.ndim == 2:
+            target = target.max(dim=1)[1]
+
+        # there may be less than 5 classes
+        maxk = min(5, output.size(-1))
+        _, pred = output.topk(maxk, 1, True, True)
+        correct = pred.eq(target[:, None])
+        correct = torch.stack([correct[:, 0], correct.any(dim=1)])
+        return correct.sum(dim=1, dtype=torch.float32) * (100.0 / batch_size)
+
+
 def mkdir(path):
     try:
         os.makedirs(path)
@@ -73,23 +73,306 @@ https://arxiv.org/abs/1405.0312, https://cocodataset.org/
 import numpy as np
 from PIL import Image
 import os
+import io
+import json
 import random
-import numpy as np
-import copy
+import threading
+import zlib
+import itertools
+import collections
+import concurrent.futures
 import cv2
+import torch
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import turbojpeg
+except ImportError:
+    turbojpeg = None
 
 from edgeai_torchmodelopt import xnn
 
 __all__ = ['coco_segmentation', 'coco_seg21']
 
 
+# the segmentation of an annotation is either polygons: [seg_start, seg_end) in poly_offsets,
+# or an uncompressed rle: [seg_start, seg_end) in rle_counts
+_COCO_ANN_DTYPE = np.dtype([('image_id', np.int64), ('category_id', np.int32), ('area', np.float64),
+                            ('ann_index', np.int32), ('is_rle', np.bool_), ('seg_start', np.int64), ('seg_end', np.int64)])
+# bump this when the content of the parsed index changes, to invalidate the saved indexes
+_COCO_INDEX_VERSION = 1
+
+
+def _load_coco_fast(annotation_file):
+    '''
+    Parse a COCO instances json into flat numpy arrays instead of the pycocotools dict-of-dicts.
+    Uses orjson if it is installed. The annotations are sorted by image_id, so the annotations of
+    an image are a contiguous range that can be found with np.searchsorted. The polygon coordinates
+    and rle counts of all the annotations are concatenated into single arrays.
+    '''
+    with open(annotation_file, 'rb') as fp:
+        data = fp.read()
+    #
+    dataset = orjson.loads(data) if orjson is not None else json.loads(data)
+    del data
+
+    images = dataset['images']
+    annotations = dataset.get('annotations', [])
+    polygons = []
+    rles = []
+    seg_ranges = []
+    for obj in annotations:
+        segmentation = obj['segmentation']
+        if isinstance(segmentation, dict):
+            assert not isinstance(segmentation['counts'], str), 'compressed rle segmentations are not supported'
+            rles.append(segmentation['counts'])
+            seg_ranges.append((True, len(rles)-1, len(rles)))
+        else:
+            seg_ranges.append((False, len(polygons), len(polygons)+len(segmentation)))
+            polygons.extend(segmentation)
+        #
+    #
+    poly_offsets = np.zeros(len(polygons)+1, dtype=np.int64)
+    np.cumsum(np.array([len(polygon) for polygon in polygons], dtype=np.int64), out=poly_offsets[1:])
+    poly_coords = np.fromiter(itertools.chain.from_iterable(polygons), dtype=np.float64, count=poly_offsets[-1])
+    rle_offsets = np.zeros(len(rles)+1, dtype=np.int64)
+    np.cumsum(np.array([len(counts) for counts in rles], dtype=np.int64), out=rle_offsets[1:])
+    rle_counts = np.fromiter(itertools.chain.from_iterable(rles), dtype=np.uint32, count=rle_offsets[-1])
+
+    anns = np.fromiter(((obj['image_id'], obj['category_id'], obj['area'], ann_index, is_rle,
+                         rle_offsets[seg_start] if is_rle else seg_start, rle_offsets[seg_end] if is_rle else seg_end)
+                        for ann_index, (obj, (is_rle, seg_start, seg_end)) in enumerate(zip(annotations, seg_ranges))),
+                       dtype=_COCO_ANN_DTYPE, count=len(annotations))
+    anns = anns[np.argsort(anns['image_id'], kind='stable')]
+    coco_index = dict(
+        img_ids=np.array([img['id'] for img in images], dtype=np.int64),
+        file_names=np.array([img['file_name'] for img in images], dtype=np.str_),
+        heights=np.array([img['height'] for img in images], dtype=np.int32),
+        widths=np.array([img['width'] for img in images], dtype=np.int32),
+        cat_ids=np.array([cat['id'] for cat in dataset.get('categories', [])], dtype=np.int64),
+        anns=anns,
+        poly_offsets=poly_offsets,
+        poly_coords=poly_coords,
+        rle_counts=rle_counts)
+    return coco_index
+
+
+def _load_coco_index(annotation_file, cache_dir=None):
+    '''
+    Load the parsed index of a COCO instances json from a .npz file saved next to it (or in cache_dir),
+    instead of parsing the json again. The .npz is created on first use and is recreated when the
+    size or modification time of the json, or the index version, change.
+    '''
+    index_dir = os.path.dirname(annotation_file) if cache_dir is None else cache_dir
+    index_file = os.path.join(index_dir, os.path.basename(annotation_file) + '.index.npz')
+    ann_stat = os.stat(annotation_file)
+    key = np.array([_COCO_INDEX_VERSION, ann_stat.st_size, ann_stat.st_mtime_ns], dtype=np.int64)
+    if os.path.exists(index_file):
+        try:
+            with np.load(index_file, allow_pickle=False) as index_data:
+                if np.array_equal(index_data['key'], key):
+                    return {k: index_data[k] for k in index_data.files if k != 'key'}
+                #
+            #
+        except (OSError, ValueError, KeyError):
+            pass
+        #
+    #
+    coco_index = _load_coco_fast(annotation_file)
+    tmp_file = f'{index_file}.{os.getpid()}.tmp.npz'
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        np.savez(tmp_file, key=key, **coco_index)
+        os.replace(tmp_file, index_file)
+    except OSError as e:
+        print(f'=> could not save the coco index to {index_file}: {e}')
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        #
+    #
+    return coco_index
+
+
+# target cache file: magic, crc32 of the cache key, number of images - followed by the uint8 targets
+_TARGET_CACHE_MAGIC = b'COCOSEG1'
+_TARGET_CACHE_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('crc', '<u4'), ('num_imgs', '<u4')])
+# bump this when the way the targets are generated changes, to invalidate existing caches
+_TARGET_CACHE_VERSION = 3
+
+# without numba, images whose (N, H, W) instance masks would be larger than this are rasterized one
+# instance box at a time - with numba, all images are
+_RASTER_TILE_MIN_BYTES = 4 << 20
+
+if numba is not None:
+    # nogil instead of parallel: the kernel runs on the __getitems__ threads, and numba's parallel
+    # threading layer does not support being entered from several threads at once
+    @numba.njit(nogil=True, cache=True)
+    def _accumulate_mask_kernel(mask, cat, target, count):
+        height, width = mask.shape
+        for i in range(height):
+            for j in range(width):
+                if mask[i, j]:
+                    # first winner - the pixel is set to 255 afterwards if another instance covers it
+                    if count[i, j] == 0:
+                        target[i, j] = cat
+                    #
+                    count[i, j] += 1
+                #
+            #
+        #
+#
+
+
+def _accumulate_mask(mask, cat, target, count):
+    '''
+    Merge one (H, W) instance mask into the target and the per pixel instance count, in place.
+    target and count may be views into larger arrays (the bounding box of the instance).
+    '''
+    if numba is not None:
+        _accumulate_mask_kernel(mask, cat, target, count)
+        return
+    #
+    count += mask
+    np.maximum(target, mask*cat, out=target)
+
+
+def _merge_masks(masks, cats):
+    '''
+    Merge the (N, H, W) instance masks into a single (H, W) uint8 segmentation map with the
+    corresponding categories. Pixels covered by more than one instance are set to 255.
+    '''
+    _, height, width = masks.shape
+    # uint8 throughout: one (H, W) scratch buffer instead of an (N, H, W) product or an int64 argmax
+    target = np.zeros((height, width), dtype=np.uint8)
+    scratch = np.empty((height, width), dtype=np.uint8)
+    for mask, cat in zip(masks, cats.astype(np.uint8)):
+        np.multiply(mask, cat, out=scratch)
+        np.maximum(target, scratch, out=target)
+    #
+    count = np.add.reduce(masks, axis=0, dtype=(np.uint8 if len(masks) < 256 else np.uint16))
+    # discard overlapping instances
+    target[count > 1] = 255
+    return target
+
+
+# fractional bits of the polygon coordinates passed to cv2.fillPoly
+_FILL_POLY_SHIFT = 4
+
+
+def _to_fill_poly_points(polygon):
+    # coco coordinates have the pixel centers at +0.5, opencv at integer positions
+    points = np.round((np.asarray(polygon, dtype=np.float64) - 0.5) * (1 << _FILL_POLY_SHIFT))
+    return points.astype(np.int32).reshape(-1, 1, 2)
+
+
+# per-thread buffer for the instance masks, reused across samples instead of allocating them for each
+_mask_scratch_local = threading.local()
+
+
+def _get_mask_scratch(shape):
+    size = int(np.prod(shape))
+    buf = getattr(_mask_scratch_local, 'buf', None)
+    if buf is None or buf.size < size:
+        buf = np.empty(size, dtype=np.uint8)
+        _mask_scratch_local.buf = buf
+    #
+    masks = buf[:size].reshape(shape)
+    masks[...] = 0
+    return masks
+
+
+_JPEG_SIGNATURE = b'\xff\xd8\xff'
+# IMREAD_COLOR_RGB (OpenCV>=4.10) decodes to RGB directly, older versions decode to BGR.
+# the exif orientation is ignored, like PIL does - the annotations are for the stored orientation.
+_CV2_DECODES_RGB = hasattr(cv2, 'IMREAD_COLOR_RGB')
+_CV2_IMREAD_FLAGS = (cv2.IMREAD_COLOR_RGB if _CV2_DECODES_RGB else cv2.IMREAD_COLOR) | cv2.IMREAD_IGNORE_ORIENTATION
+# TurboJPEG holds a C handle - use one per thread
+_turbo_jpeg_local = threading.local()
+
+
+def _get_turbo_jpeg():
+    decoder = getattr(_turbo_jpeg_local, 'decoder', None)
+    if decoder is None:
+        try:
+            decoder = turbojpeg.TurboJPEG() if turbojpeg is not None else False
+        except (OSError, RuntimeError):
+            # the python package is installed, but the libturbojpeg library could not be loaded
+            decoder = False
+        #
+        _turbo_jpeg_local.decoder = decoder
+    #
+    return decoder
+
+
+def _decode_image(buf):
+    '''
+    Decode an encoded image into an RGB uint8 HWC array.
+    JPEGs are decoded with libjpeg-turbo when PyTurboJPEG is available, everything else with OpenCV.
+    PIL is only used for the formats that OpenCV can not decode.
+    '''
+    decoder = _get_turbo_jpeg()
+    if decoder and buf[:3] == _JPEG_SIGNATURE:
+        try:
+            return decoder.decode(buf, pixel_format=turbojpeg.TJPF_RGB)
+        except OSError:
+            # e.g. CMYK jpegs, which libjpeg-turbo can not convert to RGB
+            pass
+        #
+    #
+    # always 3 channels, so gray images need no separate conversion
+    image = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), _CV2_IMREAD_FLAGS)
+    if image is not None:
+        if not _CV2_DECODES_RGB:
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        #
+        return image
+    #
+    # np.asarray avoids a second copy of the PIL buffer, but the array is read-only
+    image = np.asarray(Image.open(io.BytesIO(buf)))
+    if image.ndim==2 or image.shape[2] == 1:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    #
+    return image
+
+
+_cache_worker_dataset = None
+_cache_worker_targets = None
+
+
+def _target_cache_worker_init(dataset, cache_file):
+    global _cache_worker_dataset, _cache_worker_targets
+    _cache_worker_dataset = dataset
+    _cache_worker_targets = np.memmap(cache_file, dtype=np.uint8, mode='r+')
+
+
+def _target_cache_worker_fill(indices):
+    dataset, targets = _cache_worker_dataset, _cache_worker_targets
+    for idx in indices:
+        height, width = dataset._img_shapes[idx]
+        offset = dataset._target_offsets[idx]
+        target = dataset._compute_target(idx)
+        targets[offset:offset+height*width] = target.reshape(-1)
+    #
+    targets.flush()
+
+
 class COCOSegmentation():
     '''
     Modified from torchvision: https://github.com/pytorch/vision/references/segmentation/coco_utils.py
     Reference: https://github.com/pytorch/vision/blob/master/docs/source/models.rst
     '''
-    def __init__(self, root, split, shuffle=False, num_imgs=None, num_classes=None):
-        from pycocotools.coco import COCO
+    def __init__(self, root, split, shuffle=False, num_imgs=None, num_classes=None, cache_dir=None,
+                 num_threads=0, prefetch_factor=2, return_tensors=False):
         num_classes = 80 if num_classes is None else num_classes
         if num_classes == 21:
             self.categories = [0, 5, 2, 16, 9, 44, 6, 3, 17, 62, 21, 67, 18, 19, 4, 1, 64, 20, 63, 7, 72]
@@ -100,20 +383,29 @@ class COCOSegmentation():
             self.categories = range(num_classes)
             self.class_names = None
         #
+        self._category_ids = np.array(self.categories, dtype=np.int32)
 
-        dataset_folders = os.listdir(root)
-        assert 'annotations' in dataset_folders, 'invalid path to coco dataset annotations'
         annotations_dir = os.path.join(root, 'annotations')
+        assert os.path.isdir(annotations_dir), 'invalid path to coco dataset annotations'
 
-        image_base_dir = 'images' if ('images' in dataset_folders) else ''
-        image_base_dir = os.path.join(root, image_base_dir)
-        image_split_dirs = os.listdir(image_base_dir)
+        image_base_dir = os.path.join(root, 'images')
+        image_base_dir = image_base_dir if os.path.isdir(image_base_dir) else root
         image_dir = os.path.join(image_base_dir, split)
 
-        self.coco_dataset = COCO(os.path.join(annotations_dir, f'instances_{split}.json'))
+        annotation_file = os.path.join(annotations_dir, f'instances_{split}.json')
+        coco_index = _load_coco_index(annotation_file, cache_dir)
+        self._anns = coco_index['anns']
+        self._poly_offsets = coco_index['poly_offsets']
+        self._poly_coords = coco_index['poly_coords']
+        self._rle_counts = coco_index['rle_counts']
 
-        self.cat_ids = self.coco_dataset.getCatIds()
-        img_ids = self.coco_dataset.getImgIds()
+        # category_id -> index in self.categories, 255 for the categories that are not used
+        max_cat_id = max(90, int(self._anns['category_id'].max()) if len(self._anns) else 0)
+        self._cat_lut = np.full(max_cat_id+1, 255, dtype=np.uint8)
+        self._cat_lut[self._category_ids] = np.arange(len(self._category_ids))
+
+        self.cat_ids = coco_index['cat_ids'].tolist()
+        img_ids = coco_index['img_ids']
         self.img_ids = self._remove_images_without_annotations(img_ids)
 
         if shuffle:
@@ -123,107 +415,301 @@ class COCOSegmentation():
 
         if num_imgs is not None:
             self.img_ids = self.img_ids[:num_imgs]
-            self.coco_dataset.imgs = {k:self.coco_dataset.imgs[k] for k in self.img_ids}
         #
 
-        imgs = []
-        for img_id in self.img_ids:
-            img = self.coco_dataset.loadImgs([img_id])[0]
-            imgs.append(os.path.join(image_dir, img['file_name']))
-        #
-        self.imgs = imgs
+        # (start, end) of the annotations of each selected image in self._anns, which is sorted by image_id
+        ann_image_ids = self._anns['image_id']
+        selected_ids = np.array(self.img_ids, dtype=np.int64)
+        self._ann_ranges = np.stack([np.searchsorted(ann_image_ids, selected_ids, side='left'),
+                                     np.searchsorted(ann_image_ids, selected_ids, side='right')], axis=1)
+
+        # position of each selected image in the image records
+        img_sorter = np.argsort(coco_index['img_ids'], kind='stable')
+        img_pos = img_sorter[np.searchsorted(coco_index['img_ids'], selected_ids, sorter=img_sorter)]
+        self._img_shapes = np.stack([coco_index['heights'][img_pos], coco_index['widths'][img_pos]], axis=1).astype(np.int64)
+
+        image_prefix = os.fspath(image_dir) + os.sep
+        self.imgs = [image_prefix + file_name for file_name in coco_index['file_names'][img_pos].tolist()]
         self.num_imgs = len(self.imgs)
 
+        # optional cache of the rasterized targets, so that the polygons are decoded only once
+        self._target_cache_file = None
+        self._target_cache = None
+        if cache_dir is not None:
+            self._build_target_cache(cache_dir, split, annotation_file)
+        #
+
+        # threads used by __getitems__ to overlap reading, decoding and rasterizing the samples of a batch,
+        # and to rasterize the target of a sample while its image is decoded
+        self.num_threads = num_threads
+        self.prefetch_factor = prefetch_factor
+        self.return_tensors = return_tensors
+        self._executors = None
+        self._executor_pid = None
+
+    def __getstate__(self):
+        # the memmap and the thread pools are created again in each process on first access
+        state = self.__dict__.copy()
+        state['_target_cache'] = None
+        state['_executors'] = None
+        return state
+
     def __getitem__(self, idx, with_label=True):
         if with_label:
-            image = Image.open(self.imgs[idx])
-            ann_ids = self.coco_dataset.getAnnIds(imgIds=self.img_ids[idx], iscrowd=None)
-            anno = self.coco_dataset.loadAnns(ann_ids)
-            image, anno = self._filter_and_remap_categories(image, anno)
-            image, target = self._convert_polys_to_mask(image, anno)
-            image = np.array(image)
-            if image.ndim==2 or image.shape[2] == 1:
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
-            #
-            target = np.array(target)
-            return image, target
+            return self._load_sample(idx, self.read_bytes(idx))
         else:
             return self.imgs[idx]
         #
 
+    def __getitems__(self, indices):
+        # batched fetch used by torch.utils.data.DataLoader (torch>=2.0): the file reads run up to
+        # prefetch_factor samples ahead of the decode + rasterize stage, both on a thread pool
+        if not self.num_threads or len(indices) <= 1:
+            return [self[idx] for idx in indices]
+        #
+        executor, _ = self._get_executors()
+        indices = iter(indices)
+        reads = collections.deque()
+        for idx in indices:
+            reads.append((idx, executor.submit(self.read_bytes, idx)))
+            if len(reads) >= max(self.prefetch_factor, 1):
+                break
+            #
+        #
+        samples = []
+        while reads:
+            idx, read = reads.popleft()
+            next_idx = next(indices, None)
+            if next_idx is not None:
+                reads.append((next_idx, executor.submit(self.read_bytes, next_idx)))
+            #
+            samples.append(executor.submit(self._load_sample, idx, read.result()))
+        #
+        return [sample.result() for sample in samples]
+
     def __len__(self):
         return self.num_imgs
 
-    def _remove_images_without_annotations(self, img_ids):
-        ids = []
-        for ds_idx, img_id in enumerate(img_ids):
-            ann_ids = self.coco_dataset.getAnnIds(imgIds=img_id, iscrowd=None)
-            anno = self.coco_dataset.loadAnns(ann_ids)
-            if self.categories:
-                anno = [obj for obj in anno if obj["category_id"] in self.categories]
-            if self._has_valid_annotation(anno):
-                ids.append(img_id)
-            #
+    def read_bytes(self, idx):
+        with open(self.imgs[idx], 'rb') as fp:
+            return fp.read()
         #
-        return ids
 
-    def _has_valid_annotation(self, anno):
-        # if it's empty, there is no annotation
+    def decode_image(self, buf):
+        return _decode_image(buf)
+
+    def rasterize_polys(self, anno, h, w):
+        cats = anno['category_id']
         if len(anno) == 0:
-            return False
-        # if more than 1k pixels occupied in the image
-        return sum(obj["area"] for obj in anno) > 1000
+            return np.zeros((h, w), dtype=np.uint8)
+        elif numba is None and len(anno)*h*w <= _RASTER_TILE_MIN_BYTES:
+            segmentations = [self._get_segmentation(obj, h, w) for obj in anno]
+            masks = self._convert_poly_to_mask(segmentations, h, w)
+            # merge all instance masks into a single segmentation map
+            # with its corresponding categories
+            return _merge_masks(masks, cats)
+        #
+        # many instances (or numba available): rasterize each instance only within its bounding box and
+        # merge it into the target right away, so that the working set is one box instead of the (N, H, W) masks.
+        # the boxes are clipped to the image, so the polygons are clipped at the same place as before.
+        target = np.zeros((h, w), dtype=np.uint8)
+        count = np.zeros((h, w), dtype=(np.uint8 if len(anno) < 256 else np.uint16))
+        for obj, cat, (y0, y1, x0, x1) in zip(anno, cats.astype(np.uint8), self._get_instance_boxes(anno, h, w)):
+            if y1 > y0 and x1 > x0:
+                segmentation = self._get_segmentation(obj, h, w, offset=(x0, y0))
+                mask = self._convert_poly_to_mask([segmentation], y1-y0, x1-x0)[0]
+                _accumulate_mask(mask, cat, target[y0:y1, x0:x1], count[y0:y1, x0:x1])
+            #
+        #
+        # discard overlapping instances
+        target[count > 1] = 255
+        return target
+
+    def _get_segmentation(self, obj, h, w, offset=None):
+        # in the format of the json, with numpy arrays in place of the lists - pycocotools accepts both
+        seg_start, seg_end = obj['seg_start'], obj['seg_end']
+        if obj['is_rle']:
+            return {'size': [h, w], 'counts': self._rle_counts[seg_start:seg_end]}
+        #
+        poly_offsets = self._poly_offsets
+        polygons = [self._poly_coords[poly_offsets[k]:poly_offsets[k+1]] for k in range(seg_start, seg_end)]
+        if offset is not None and any(offset):
+            polygons = [polygon - np.tile(offset, len(polygon)//2) for polygon in polygons]
+        #
+        return polygons
+
+    def _get_instance_boxes(self, anno, h, w):
+        # (y0, y1, x0, x1) of the pixels that the polygons of each instance can touch, the whole image for rles.
+        # one pixel of margin before the minimum, as fillPoly draws the polygon outline too
+        poly_offsets = self._poly_offsets
+        boxes = np.empty((len(anno), 4), dtype=np.int64)
+        for k, obj in enumerate(anno):
+            if obj['is_rle']:
+                boxes[k] = (0, h, 0, w)
+                continue
+            #
+            coords = self._poly_coords[poly_offsets[obj['seg_start']]:poly_offsets[obj['seg_end']]]
+            if len(coords) >= 2:
+                xs, ys = coords[0::2], coords[1::2]
+                boxes[k] = (np.floor(ys.min())-1, np.ceil(ys.max())+1, np.floor(xs.min())-1, np.ceil(xs.max())+1)
+            else:
+                boxes[k] = (0, 0, 0, 0)
+            #
+        #
+        return np.clip(boxes, 0, [h, h, w, w])
+
+    def _load_sample(self, idx, buf):
+        # the size of the target comes from the annotations, so it can be rasterized while the image is decoded
+        if self.num_threads:
+            _, target_executor = self._get_executors()
+            target = target_executor.submit(self._get_target, idx)
+            image = self.decode_image(buf)
+            target = target.result()
+        else:
+            image = self.decode_image(buf)
+            target = self._get_target(idx)
+        #
+        assert image.shape[:2] == target.shape, f'image size does not match the annotations: {self.imgs[idx]}'
+        target = np.array(target)
+        if self.return_tensors:
+            # uint8 HWC / HW tensors that share the memory of the decoded arrays
+            image = torch.from_numpy(image if image.flags.writeable else image.copy())
+            target = torch.from_numpy(target)
+        #
+        return image, target
+
+    def _get_executors(self):
+        # a thread pool inherited through fork has no threads, so create them per process.
+        # the targets get their own pool, so that a sample running on the first one can wait for its target.
+        if self._executors is None or self._executor_pid != os.getpid():
+            self._executors = (concurrent.futures.ThreadPoolExecutor(self.num_threads),
+                               concurrent.futures.ThreadPoolExecutor(self.num_threads))
+            self._executor_pid = os.getpid()
+        #
+        return self._executors
+
+    def _remove_images_without_annotations(self, img_ids):
+        if len(img_ids) == 0 or len(self._anns) == 0:
+            return []
+        #
+        anns = self._anns
+        img_ids = np.array(img_ids, dtype=np.int64)
+        # position of the image of each annotation in img_ids
+        sorter = np.argsort(img_ids, kind='stable')
+        pos = np.searchsorted(img_ids, anns['image_id'], sorter=sorter)
+        img_index = sorter[np.minimum(pos, len(img_ids)-1)]
+        valid = (img_ids[img_index] == anns['image_id']) & (self._cat_lut[anns['category_id']] != 255)
+        # keep the image only if more than 1k pixels are occupied by the selected categories
+        area = np.bincount(img_index[valid], weights=anns['area'][valid], minlength=len(img_ids))
+        return img_ids[area > 1000].tolist()
 
     def _filter_and_remap_categories(self, image, anno, remap=True):
-        anno = [obj for obj in anno if obj["category_id"] in self.categories]
+        cats = self._cat_lut[anno['category_id']]
+        valid = cats != 255
+        # boolean indexing returns a copy, so the remap below does not modify self._anns
+        anno = anno[valid]
         if not remap:
             return image, anno
         #
-        anno = copy.deepcopy(anno)
-        for obj in anno:
-            obj["category_id"] = self.categories.index(obj["category_id"])
-        #
+        anno['category_id'] = cats[valid]
         return image, anno
 
-    def _convert_polys_to_mask(self, image, anno):
-        w, h = image.size
-        segmentations = [obj["segmentation"] for obj in anno]
-        cats = [obj["category_id"] for obj in anno]
-        if segmentations:
-            masks = self._convert_poly_to_mask(segmentations, h, w)
-            cats = np.array(cats, dtype=masks.dtype)
-            cats = cats.reshape(-1, 1, 1)
-            # merge all instance masks into a single segmentation map
-            # with its corresponding categories
-            target = (masks * cats).max(axis=0)
-            # discard overlapping instances
-            target[masks.sum(0) > 1] = 255
-        else:
-            target = np.zeros((h, w), dtype=np.uint8)
+    def _get_target(self, idx):
+        if self._target_cache_file is None:
+            return self._compute_target(idx)
         #
-        return image, target
+        if self._target_cache is None:
+            self._target_cache = np.memmap(self._target_cache_file, dtype=np.uint8, mode='r')
+        #
+        height, width = self._img_shapes[idx]
+        offset = self._target_offsets[idx]
+        return self._target_cache[offset:offset+height*width].reshape(height, width)
+
+    def _compute_target(self, idx):
+        height, width = self._img_shapes[idx]
+        start, end = self._ann_ranges[idx]
+        _, anno = self._filter_and_remap_categories(None, self._anns[start:end])
+        return self.rasterize_polys(anno, height, width)
+
+    def _build_target_cache(self, cache_dir, split, annotation_file):
+        sizes = self._img_shapes[:,0] * self._img_shapes[:,1]
+        self._target_offsets = _TARGET_CACHE_HEADER_DTYPE.itemsize + np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        total_size = _TARGET_CACHE_HEADER_DTYPE.itemsize + int(sizes.sum())
+
+        # everything the targets depend on goes into the crc, so that a stale cache is rebuilt
+        ann_stat = os.stat(annotation_file)
+        key = np.array([_TARGET_CACHE_VERSION, ann_stat.st_size, ann_stat.st_mtime_ns], dtype=np.int64).tobytes()
+        key += np.array(self.img_ids, dtype=np.int64).tobytes() + self._img_shapes.tobytes() + self._category_ids.tobytes()
+        crc = zlib.crc32(key)
+
+        cache_file = os.path.join(cache_dir, f'coco_targets_{split}_{len(self.categories)}classes.bin')
+        if os.path.exists(cache_file) and os.path.getsize(cache_file) == total_size:
+            header = np.fromfile(cache_file, dtype=_TARGET_CACHE_HEADER_DTYPE, count=1)[0]
+            if header['magic'] == _TARGET_CACHE_MAGIC and header['crc'] == crc and header['num_imgs'] == self.num_imgs:
+                self._target_cache_file = cache_file
+                return
+            #
+        #
+
+        print(f'=> building the target cache {cache_file}')
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        try:
+            np.memmap(tmp_file, dtype=np.uint8, mode='w+', shape=(total_size,)).flush()
+            chunks = [range(start, min(start+256, self.num_imgs)) for start in range(0, self.num_imgs, 256)]
+            with concurrent.futures.ProcessPoolExecutor(initializer=_target_cache_worker_init,
+                                                        initargs=(self, tmp_file)) as executor:
+                for _ in executor.map(_target_cache_worker_fill, chunks):
+                    pass
+                #
+            #
+            # the header is written last, so an interrupted build is never taken as valid
+            header = np.array([(_TARGET_CACHE_MAGIC, crc, self.num_imgs)], dtype=_TARGET_CACHE_HEADER_DTYPE)
+            with open(tmp_file, 'r+b') as fp:
+                fp.write(header.tobytes())
+            #
+            os.replace(tmp_file, cache_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            #
+        #
+        self._target_cache_file = cache_file
 
     def _convert_poly_to_mask(self, segmentations, height, width):
+        # the masks are a view of a per-thread scratch buffer - only valid until the next call in the same thread
         from pycocotools import mask as coco_mask
-        masks = []
-        for polygons in segmentations:
-            rles = coco_mask.frPyObjects(polygons, height, width)
-            mask = coco_mask.decode(rles)
-            if len(mask.shape) < 3:
-                mask = mask[..., None]
-            mask = mask.any(axis=2)
-            mask = mask.astype(np.uint8)
-            masks.append(mask)
-        if masks:
-            masks = np.stack(masks, axis=0)
-        else:
-            masks = np.zeros((0, height, width), dtype=np.uint8)
+        masks = _get_mask_scratch((len(segmentations), height, width))
+        rles = []
+        rle_masks = []
+        for mask, segmentation in zip(masks, segmentations):
+            if isinstance(segmentation, dict):
+                rles.append(segmentation)
+                rle_masks.append(mask)
+            else:
+                # polygons are drawn directly, without going through rle. one fillPoly call per polygon:
+                # a single call fills several contours with even-odd parity, which would punch holes where
+                # the polygons of an instance overlap instead of taking their union like pycocotools
+                for polygon in segmentation:
+                    cv2.fillPoly(mask, [_to_fill_poly_points(polygon)], 1,
+                                 lineType=cv2.LINE_8, shift=_FILL_POLY_SHIFT)
+                #
+            #
+        #
+        if rles:
+            # (H, W, K) for all the K rles, decoded in one call
+            decoded = coco_mask.decode(coco_mask.frPyObjects(rles, height, width))
+            for k, mask in enumerate(rle_masks):
+                mask[...] = decoded[:, :, k]
+            #
+        #
         return masks
 
 
 class COCOSegmentationPlus(COCOSegmentation):
     NUM_CLASSES = 80
     def __init__(self, *args, num_classes=NUM_CLASSES, transforms=None, **kwargs):
+        assert not kwargs.get('return_tensors', False), 'the transforms of COCOSegmentationPlus work on numpy arrays'
         # 21 class is a special case, otherwise use all the classes
         # in get_item a modulo is done to map the target to the required num_classes
         super().__init__(*args, num_classes=(num_classes if num_classes==21 else self.NUM_CLASSES), **kwargs)
@@ -237,8 +723,8 @@ class COCOSegmentationPlus(COCOSegmentation):
         self.label_colours = dict(zip(range(self.num_classes_), self.colors))
         self.transforms = transforms
 
-    def __getitem__(self, item):
-        image, target = super().__getitem__(item)
+    def _load_sample(self, idx, buf):
+        image, target = super()._load_sample(idx, buf)
         target = np.remainder(target, self.num_classes_)
         image = [image]
         target = [target]
@@ -281,6 +767,11 @@ class COCOSegmentationPlus(COCOSegmentation):
 def get_config():
     dataset_config = xnn.utils.ConfigNode()
     dataset_config.num_classes = 80
+    # directory to cache the rasterized targets in - None disables the cache
+    dataset_config.cache_dir = None
+    # threads per DataLoader worker to load the samples of a batch in parallel - 0 disables them
+    dataset_config.num_threads = 0
+    dataset_config.prefetch_factor = 2
     return dataset_config
 
 def coco_segmentation(dataset_config, root, split=None, transforms=None, *args, **kwargs):
@@ -290,10 +781,12 @@ def coco_segmentation(dataset_config, root, split=None, transforms=None, *args,
     for split_name in split:
         if split_name.startswith('train'):
             train_split = COCOSegmentationPlus(root, split_name, num_classes=dataset_config.num_classes,
-                            transforms=transforms[0], *args, **kwargs)
+                            cache_dir=dataset_config.cache_dir, num_threads=dataset_config.num_threads,
+                            prefetch_factor=dataset_config.prefetch_factor, transforms=transforms[0], *args, **kwargs)
         elif split_name.startswith('val'):
             val_split = COCOSegmentationPlus(root, split_name, num_classes=dataset_config.num_classes,
-                            transforms=transforms[1], *args, **kwargs)
+                            cache_dir=dataset_config.cache_dir, num_threads=dataset_config.num_threads,
+                            prefetch_factor=dataset_config.prefetch_factor, transforms=transforms[1], *args, **kwargs)
         else:
             assert False, 'unknown split'
         #
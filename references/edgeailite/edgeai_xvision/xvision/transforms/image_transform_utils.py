@@ -235,6 +235,10 @@ class ImageTransformUtils(object):
         if len(array.shape) < 3:
             array = array[np.newaxis, ...]
         #
+        if not array.flags.writeable:
+            # e.g. decoded image buffers - torch.from_numpy warns on read-only arrays, so do the float copy in numpy
+            return torch.from_numpy(array.astype(np.float32))
+        #
         tensor = torch.from_numpy(array)
         return tensor.float()
 
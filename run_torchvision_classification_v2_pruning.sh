@@ -47,7 +47,7 @@ command="./references/classification/train.py --data-path=./data/datasets/imagen
 --epochs=80 --batch-size=256 --wd=4e-5 --lr=0.005 --lr-scheduler=cosineannealinglr --lr-warmup-epochs=3 \
 --model=${model} --model-surgery=2 --quantization=0 --quantization-type=WT8SP2_AT8SP2 --val-epoch-size-factor=1 \
 --train-epoch-size-factor=1 --opset-version=18 --val-resize-size=$val_resize_size --val-crop-size=$val_crop_size \
---pruning=2 --pruning-type=n2m --pruning-global=0 --pruning-ratio=0.640625 --pruning-m=64 --pruning-init-train-ep=5"
+--pruning=2 --pruning-type=n2m --pruning-global=0 --pruning-ratio=0.640625 --pruning-m=64 --pruning-init-train-ep=5 --find-unused-parameters=1"
 
 # training: single GPU (--device=cuda:0)or CPU (--device=cpu) run
 # python3 ${command} --weights=${model_weights} --output-dir=${output_dir}
@@ -0,0 +1,50 @@
+import importlib.machinery
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("edgeai_torchmodelopt")
+coco_mask = pytest.importorskip("pycocotools.mask")
+
+
+def import_coco_plus_from_references():
+    HERE = Path(__file__).parent
+    PROJECT_ROOT = HERE.parent
+
+    path = PROJECT_ROOT / "references" / "edgeailite" / "edgeai_xvision" / "xvision" / "datasets" / "coco_plus.py"
+    loader = importlib.machinery.SourceFileLoader("coco_plus", str(path))
+    spec = importlib.util.spec_from_loader("coco_plus", loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+coco_plus = import_coco_plus_from_references()
+
+
+class TestCOCOSegmentationMasks:
+    @pytest.mark.parametrize(
+        "polygons",
+        [
+            [[10, 10, 60, 10, 60, 60, 10, 60], [30, 30, 90, 30, 90, 90, 30, 90]],
+            [[5.3, 5.1, 70.2, 8.7, 40.5, 80.9], [20, 20, 100, 25, 60, 95], [0, 50, 110, 50, 110, 60, 0, 60]],
+        ],
+    )
+    def test_overlapping_polygons_of_one_instance(self, polygons):
+        height, width = 100, 120
+        # _convert_poly_to_mask does not use the dataset state
+        dataset = coco_plus.COCOSegmentation.__new__(coco_plus.COCOSegmentation)
+        segmentation = [np.array(polygon, dtype=np.float64) for polygon in polygons]
+        mask = dataset._convert_poly_to_mask([segmentation], height, width)[0].astype(bool)
+
+        # the union of the polygons, as pycocotools merges them
+        expected = coco_mask.decode(coco_mask.frPyObjects(polygons, height, width)).any(axis=2)
+        # fillPoly also draws the polygon outline, so it can only add pixels on the border of the union
+        assert not (expected & ~mask).any()
+        union = np.zeros((height, width), dtype=bool)
+        for polygon in segmentation:
+            union |= dataset._convert_poly_to_mask([[polygon]], height, width)[0].astype(bool)
+        assert (mask == union).all()